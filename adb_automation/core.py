@@ -3,20 +3,53 @@ Android Automation Core - Built from scratch
 基于 ADB 和 UI 分析的 Android 自动化核心库
 """
 
+import os
+import queue
 import subprocess
+import threading
 import json
 import time
 import re
-from typing import Dict, List, Tuple, Optional
+import hashlib
+import shlex
+import uuid
+import struct
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from xml.parsers import expat
+from typing import Callable, Dict, List, Tuple, Optional, Union
 from dataclasses import dataclass
 import base64
+import numpy as np
 from PIL import Image
 import io
 
+# Windows 下启动 adb 时不分配控制台窗口
+_POPEN_FLAGS = getattr(subprocess, 'CREATE_NO_WINDOW', 0) if os.name == 'nt' else 0
+
+# UI dump 中的边界格式 '[x1,y1][x2,y2]'
+_BOUNDS_RE = re.compile(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]')
+
+
+def _may_occur_in_xml(xml_content: Union[str, bytes], value: str) -> bool:
+    """
+    粗略判断属性值是否可能出现在 XML 文档中（C 层面的子串查找）
+
+    返回 False 时一定没有节点的属性包含该值；值中含有序列化时可能被转义的字符
+    （XML 特殊字符、控制字符，以及 Android 写成 &#128512; 这类字符引用的
+    BMP 以外字符，如 emoji）时总是返回 True
+    """
+    if any(ch in '<>&"\'' or ord(ch) < 0x20 or ord(ch) > 0xFFFF for ch in value):
+        return True
+    needle = value.encode('utf-8') if isinstance(xml_content, bytes) else value
+    return needle in xml_content
+
 
 @dataclass
 class UIElement:
     """UI 元素数据类"""
+    __slots__ = ('resource_id', 'text', 'class_name', 'bounds', 'clickable', 'enabled')
+
     resource_id: str
     text: str
     class_name: str
@@ -28,12 +61,27 @@ class UIElement:
 class AndroidDevice:
     """Android 设备控制器"""
 
-    def __init__(self, device_id: Optional[str] = None):
+    # 每次操作后的固定等待时间（秒）。input/am 命令在 shell 返回时已执行完毕，
+    # 默认不等待；需要等待界面稳定时使用 wait_for_idle() 或各处的条件轮询
+    action_delay: float = 0
+
+    def __init__(self, device_id: Optional[str] = None,
+                 action_delays: Optional[Dict[str, float]] = None):
         """
         初始化 Android 设备连接
         Args:
             device_id: 设备 ID，如果为 None 则使用第一个连接的设备
+            action_delays: 按操作名 (tap, swipe, input_text, press_key,
+                           start_app, stop_app) 单独指定等待时间，未指定的使用 action_delay
         """
+        self.action_delays = dict(action_delays or {})
+        self._analyzers = weakref.WeakSet()  # 需要在界面变化时失效缓存的分析器
+        self._shell_proc: Optional[subprocess.Popen] = None  # 常驻 adb shell 会话
+        self._shell_lines: Optional[queue.Queue] = None  # 后台线程读出的 shell 输出行
+        self._frame_buf: Optional[np.ndarray] = None  # 复用的截屏缓冲区
+        self._screencap_header_size: Optional[int] = None
+        # 最近一次 snapshot(): (开始采集的时间, RGBA 帧, UI XML)
+        self._snapshot: Optional[Tuple[float, np.ndarray, str]] = None
         self.device_id = device_id or self._get_first_device()
         self._verify_connection()
 
@@ -58,51 +106,168 @@ class AndroidDevice:
         except Exception as e:
             raise Exception(f"设备连接验证失败: {e}")
 
-    def _run_adb_command(self, cmd: List[str], timeout: int = 30) -> str:
-        """执行 ADB 命令"""
+    def _adb_command_line(self, cmd: List[str]) -> List[str]:
+        """拼接完整的 adb 命令行"""
         full_cmd = ['adb']
         if self.device_id:
             full_cmd.extend(['-s', self.device_id])
         full_cmd.extend(cmd)
+        return full_cmd
+
+    def _run_adb_command(self, cmd: List[str], timeout: int = 30,
+                         binary: bool = False) -> Union[str, bytes]:
+        """执行 ADB 命令，binary=True 时返回原始字节"""
+        full_cmd = self._adb_command_line(cmd)
 
         try:
             result = subprocess.run(
                 full_cmd,
                 capture_output=True,
-                text=True,
                 timeout=timeout,
-                check=True
+                check=True,
+                creationflags=_POPEN_FLAGS
             )
-            return result.stdout
         except subprocess.CalledProcessError as e:
-            raise Exception(f"ADB 命令失败: {' '.join(full_cmd)}\n错误: {e.stderr}")
+            stderr = e.stderr.decode('utf-8', errors='replace')
+            raise Exception(f"ADB 命令失败: {' '.join(full_cmd)}\n错误: {stderr}")
         except subprocess.TimeoutExpired:
             raise Exception(f"ADB 命令超时: {' '.join(full_cmd)}")
 
+        # 设备输出固定为 UTF-8，不依赖本机 locale（中文 Windows 默认为 GBK）
+        return result.stdout if binary else result.stdout.decode('utf-8', errors='replace')
+
+    def _get_shell(self) -> subprocess.Popen:
+        """获取常驻的 adb shell 进程（按需启动，断开后自动重连）"""
+        if self._shell_proc is None or self._shell_proc.poll() is not None:
+            # 管道以二进制打开并自行编解码 UTF-8：文本模式在 Windows 上会把写入的
+            # '\n' 转换为 '\r\n'，设备端 sh 会把 '\r' 当作命令参数的一部分
+            self._shell_proc = subprocess.Popen(
+                self._adb_command_line(['shell']),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                creationflags=_POPEN_FLAGS
+            )
+            # 由后台线程读取输出，读取端可以带超时等待
+            self._shell_lines = queue.Queue()
+            threading.Thread(target=self._pump_shell_output,
+                             args=(self._shell_proc.stdout, self._shell_lines),
+                             daemon=True).start()
+        return self._shell_proc
+
+    @staticmethod
+    def _pump_shell_output(stream, lines: queue.Queue):
+        """后台线程: 逐行转发 shell 输出，会话结束时放入 None"""
+        for raw_line in iter(stream.readline, b''):
+            lines.put(raw_line)
+        lines.put(None)
+
+    def _shell(self, command: str, timeout: float = 30) -> str:
+        """
+        在常驻 shell 中执行命令，读取输出直到结束标记
+
+        结束标记后附带命令的退出码，非 0 时抛出异常；超时未结束时关闭会话并抛出异常
+        """
+        proc = self._get_shell()
+        lines = self._shell_lines
+        sentinel = f"__END_{uuid.uuid4().hex}__"
+
+        try:
+            proc.stdin.write(f"{command}\necho {sentinel} $?\n".encode('utf-8'))
+            proc.stdin.flush()
+        except OSError as e:
+            self.close()
+            raise Exception(f"ADB shell 写入失败: {e}")
+
+        deadline = time.monotonic() + timeout
+        output = []
+        while True:
+            try:
+                raw_line = lines.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                # 会话状态未知，丢弃后下次重新建立
+                self.close()
+                raise Exception(f"ADB 命令超时: {command}")
+
+            if raw_line is None:
+                self.close()
+                raise Exception(f"ADB shell 会话意外结束: {command}")
+
+            line = raw_line.decode('utf-8', errors='replace')
+            # 命令输出末尾没有换行时，结束标记会接在同一行
+            index = line.find(sentinel)
+            if index < 0:
+                output.append(line)
+                continue
+
+            output.append(line[:index])
+            result = ''.join(output)
+            status = line[index + len(sentinel):].strip()
+            if status != '0':
+                raise Exception(f"ADB 命令失败: {command}\n错误: {result}")
+            return result
+
+    @staticmethod
+    def _quote_command(cmd: List[str]) -> str:
+        """将参数列表转义为一条 shell 命令"""
+        return ' '.join(shlex.quote(str(arg)) for arg in cmd)
+
+    def run_batch(self, commands: List[List[str]]) -> str:
+        """在一次 shell 往返中依次执行多条命令"""
+        script = '; '.join(self._quote_command(cmd) for cmd in commands)
+        output = self._shell(script)
+        self._notify_ui_changed()
+        return output
+
+    def _perform_action(self, action: str, cmd: List[str]) -> str:
+        """通过常驻 shell 执行一次设备操作，并按配置等待"""
+        output = self._shell(self._quote_command(cmd))
+        self._notify_ui_changed()
+
+        delay = self.action_delays.get(action, self.action_delay)
+        if delay > 0:
+            time.sleep(delay)
+        return output
+
+    def close(self):
+        """关闭常驻 shell 会话"""
+        if self._shell_proc is not None:
+            if self._shell_proc.poll() is None:
+                self._shell_proc.terminate()
+            self._shell_proc = None
+            self._shell_lines = None
+
+    def _register_analyzer(self, analyzer: 'UIAnalyzer'):
+        """注册 UI 分析器，设备操作后自动使其缓存失效"""
+        self._analyzers.add(analyzer)
+
+    def _notify_ui_changed(self):
+        """通知已注册的分析器界面可能已变化"""
+        self._snapshot = None
+        for analyzer in list(self._analyzers):
+            analyzer.invalidate()
+
     def tap(self, x: int, y: int):
         """点击坐标"""
-        self._run_adb_command(['shell', 'input', 'tap', str(x), str(y)])
-        time.sleep(0.5)  # 等待点击生效
+        self._perform_action('tap', ['input', 'tap', x, y])
 
     def swipe(self, x1: int, y1: int, x2: int, y2: int, duration: int = 500):
         """滑动操作"""
-        self._run_adb_command([
-            'shell', 'input', 'swipe',
-            str(x1), str(y1), str(x2), str(y2), str(duration)
-        ])
-        time.sleep(0.5)
+        self._perform_action('swipe', ['input', 'swipe', x1, y1, x2, y2, duration])
 
     def input_text(self, text: str):
         """输入文本"""
+        self._perform_action('input_text', ['input', 'text', self.encode_input_text(text)])
+
+    @staticmethod
+    def encode_input_text(text: str) -> str:
+        """转义 input text 参数"""
         # 处理中文和特殊字符
-        encoded_text = text.replace(' ', '%s')  # 空格需要转义
-        self._run_adb_command(['shell', 'input', 'text', encoded_text])
-        time.sleep(0.3)
+        return text.replace(' ', '%s')  # 空格需要转义
 
     def press_key(self, keycode: int):
         """按键操作"""
-        self._run_adb_command(['shell', 'input', 'keyevent', str(keycode)])
-        time.sleep(0.3)
+        self._perform_action('press_key', ['input', 'keyevent', keycode])
 
     def start_app(self, package: str, activity: str = None):
         """启动应用"""
@@ -111,13 +276,36 @@ class AndroidDevice:
         else:
             intent = package
 
-        self._run_adb_command(['shell', 'am', 'start', '-n', intent])
-        time.sleep(2)  # 等待应用启动
+        # -W 会阻塞到 Activity 显示完成，无需固定等待
+        self._perform_action('start_app', ['am', 'start', '-W', '-n', intent])
 
     def stop_app(self, package: str):
         """停止应用"""
-        self._run_adb_command(['shell', 'am', 'force-stop', package])
-        time.sleep(1)
+        self._perform_action('stop_app', ['am', 'force-stop', package])
+
+    def get_resumed_activity(self) -> str:
+        """获取当前前台 Activity 记录（不同系统版本字段名不同）"""
+        output = self._shell("dumpsys activity activities | grep -E 'mResumedActivity|topResumedActivity' || true")
+        return output.strip()
+
+    def wait_for_idle(self, timeout: float = 5, interval: float = 0.1) -> bool:
+        """
+        等待界面稳定：前台 Activity 连续两次查询结果相同即返回
+
+        Returns:
+            超时前界面已稳定返回 True
+        """
+        deadline = time.monotonic() + timeout
+        previous = None
+
+        while time.monotonic() < deadline:
+            current = self.get_resumed_activity()
+            if current and current == previous:
+                return True
+            previous = current
+            time.sleep(interval)
+
+        return False
 
     def get_screen_size(self) -> Tuple[int, int]:
         """获取屏幕尺寸"""
@@ -129,22 +317,114 @@ class AndroidDevice:
 
     def take_screenshot(self, save_path: str = None) -> Image.Image:
         """截屏"""
-        result = self._run_adb_command(['shell', 'screencap', '-p'])
-
-        # 处理 Windows 换行符问题
-        img_data = result.replace('\r\n', '\n').encode('latin-1')
-        img = Image.open(io.BytesIO(img_data))
+        img = Image.fromarray(self.take_screenshot_array(), 'RGBA')
 
         if save_path:
             img.save(save_path)
 
         return img
 
+    def take_screenshot_array(self, reuse_buffer: bool = False) -> np.ndarray:
+        """
+        截屏并返回 (H, W, 4) 的 RGBA 数组（原始帧缓冲，无 PNG 编解码）
+
+        Args:
+            reuse_buffer: 为 True 时直接读入设备持有的预分配缓冲区并返回它，
+                          下一次截屏会覆盖其内容，需要保留时请自行 copy()
+        """
+        header_size = self._get_screencap_header_size()
+        full_cmd = self._adb_command_line(['exec-out', 'screencap'])
+        proc = subprocess.Popen(full_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                creationflags=_POPEN_FLAGS)
+
+        try:
+            # 头部为 width, height, format (Android 9+ 还有 colorspace)
+            header = proc.stdout.read(header_size)
+            if len(header) < header_size:
+                raise Exception(f"截屏数据不完整: {proc.stderr.read().decode('utf-8', errors='replace')}")
+            width, height, pixel_format = struct.unpack_from('<3I', header)
+
+            frame = None
+            if pixel_format in (1, 2):  # RGBA_8888 / RGBX_8888
+                shape = (height, width, 4)
+                if not reuse_buffer:
+                    frame = np.empty(shape, dtype=np.uint8)
+                else:
+                    if self._frame_buf is None or self._frame_buf.shape != shape:
+                        self._frame_buf = np.empty(shape, dtype=np.uint8)
+                    frame = self._frame_buf
+
+                # 像素数据直接读入数组内存，不产生中间 bytes 对象
+                view = memoryview(frame).cast('B')
+                filled = 0
+                while filled < len(view):
+                    n = proc.stdout.readinto(view[filled:])
+                    if not n:
+                        raise Exception(f"截屏数据不完整: {filled}/{len(view)} 字节")
+                    filled += n
+
+                # RGBX_8888 的第四字节未定义，置为不透明
+                if pixel_format == 2:
+                    frame[..., 3] = 255
+
+                proc.wait(timeout=30)
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            proc.stderr.close()
+
+        if frame is None:
+            # 其他像素格式（如 RGB_565）退回到 PNG 输出
+            frame = self._take_screenshot_png()
+
+        return frame
+
+    def _take_screenshot_png(self) -> np.ndarray:
+        """通过 exec-out screencap -p 截屏（PNG 编码，二进制安全，无需换行符修正）"""
+        png_data = self._run_adb_command(['exec-out', 'screencap', '-p'], binary=True)
+        return np.array(Image.open(io.BytesIO(png_data)).convert('RGBA'))
+
+    def _get_screencap_header_size(self) -> int:
+        """screencap 原始输出头部长度：Android 9 (API 28) 起为 16 字节，之前为 12 字节"""
+        if self._screencap_header_size is None:
+            sdk = self._run_adb_command(['shell', 'getprop', 'ro.build.version.sdk']).strip()
+            self._screencap_header_size = 16 if sdk.isdigit() and int(sdk) >= 28 else 12
+        return self._screencap_header_size
+
+    def snapshot(self, max_age: float = 0.5) -> Tuple[np.ndarray, str]:
+        """
+        并行截屏并 dump UI 层次结构，返回 (RGBA 帧, XML)
+
+        两条 adb 命令互不依赖，并行执行时 uiautomator 的设备端耗时与截屏传输重叠。
+        max_age 秒内且期间没有设备操作时直接返回上一次的结果；
+        UIAnalyzer 也会复用其中的 XML，避免同一步骤内重复 dump
+        """
+        cached = self._snapshot
+        if cached is not None and time.monotonic() - cached[0] < max_age:
+            return cached[1], cached[2]
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            frame_future = executor.submit(self.take_screenshot_array)
+            xml_future = executor.submit(self.dump_ui_hierarchy)
+            frame, xml_content = frame_future.result(), xml_future.result()
+
+        self._snapshot = (started, frame, xml_content)
+        return frame, xml_content
+
     def dump_ui_hierarchy(self) -> str:
         """获取 UI 层次结构"""
-        # 先生成 UI dump
+        # 直接输出到 stdout，一次 ADB 调用且不读写 sdcard
+        result = self._run_adb_command(['exec-out', 'uiautomator', 'dump', '/dev/tty'])
+
+        # 去掉末尾的 "UI hierchary dumped to: /dev/tty" 提示
+        end = result.rfind('</hierarchy>')
+        if end != -1:
+            return result[result.find('<'):end + len('</hierarchy>')]
+
+        # 部分设备不支持输出到 /dev/tty，退回到先写文件再读取
         self._run_adb_command(['shell', 'uiautomator', 'dump', '/sdcard/ui_dump.xml'])
-        # 读取文件内容
         result = self._run_adb_command(['shell', 'cat', '/sdcard/ui_dump.xml'])
         return result
 
@@ -152,70 +432,193 @@ class AndroidDevice:
 class UIAnalyzer:
     """UI 分析器"""
 
-    def __init__(self, device: AndroidDevice):
+    def __init__(self, device: AndroidDevice, cache_ttl: float = 0.5):
+        """
+        Args:
+            device: Android 设备
+            cache_ttl: UI 层次结构解析结果的复用时间（秒），0 表示每次查找都重新 dump
+        """
         self.device = device
+        self.cache_ttl = cache_ttl
+
+        # 解析缓存: 原始 XML 及其哈希、按需解析的元素列表，以及按 (属性, 查询值) 缓存的查询结果
+        self._xml: Optional[str] = None
+        self._xml_hash: Optional[bytes] = None
+        self._elements: Optional[List[UIElement]] = None
+        self._xml_time = 0.0  # 当前 XML 的采集时间
+        self._parsed_time = 0.0
+        self._query_cache: Dict[Tuple[str, str], List[UIElement]] = {}
+
+        device._register_analyzer(self)
 
     def find_elements_by_text(self, text: str) -> List[UIElement]:
         """根据文本查找元素"""
-        xml_content = self.device.dump_ui_hierarchy()
-        return self._parse_elements_from_xml(xml_content, text_filter=text)
+        return self._find_elements('text', text)
 
     def find_elements_by_resource_id(self, resource_id: str) -> List[UIElement]:
         """根据 resource-id 查找元素"""
-        xml_content = self.device.dump_ui_hierarchy()
-        return self._parse_elements_from_xml(xml_content, resource_id_filter=resource_id)
+        return self._find_elements('resource_id', resource_id)
 
     def find_elements_by_class(self, class_name: str) -> List[UIElement]:
         """根据类名查找元素"""
-        xml_content = self.device.dump_ui_hierarchy()
-        return self._parse_elements_from_xml(xml_content, class_filter=class_name)
+        return self._find_elements('class_name', class_name)
+
+    def find_elements_by_any_text(self, texts: Tuple[str, ...]) -> List[UIElement]:
+        """查找文本包含任一给定字符串的元素（单次遍历）"""
+        xml_content = self._refresh_xml()
+        texts = [t for t in texts if _may_occur_in_xml(xml_content, t)]
+        if not texts:
+            return []
+        return [e for e in self.get_all_elements() if any(t in e.text for t in texts)]
+
+    def wait_for_elements(self, predicate: Callable[[UIElement], bool],
+                          timeout: float = 10, max_interval: float = 1.0) -> List[UIElement]:
+        """
+        轮询等待满足条件的元素出现，轮询间隔从 50ms 开始指数增长
 
-    def _parse_elements_from_xml(self, xml_content: str,
+        Returns:
+            满足条件的元素列表，超时返回空列表
+        """
+        return self._poll_elements(
+            lambda: [e for e in self.get_all_elements() if predicate(e)],
+            timeout, max_interval
+        )
+
+    def _poll_elements(self, query: Callable[[], List[UIElement]],
+                       timeout: float, max_interval: float = 1.0) -> List[UIElement]:
+        """每次轮询前使缓存失效并执行查询，直到返回非空结果或超时"""
+        deadline = time.monotonic() + timeout
+        interval = 0.05
+
+        while True:
+            self.invalidate()
+            try:
+                elements = query()
+                if elements:
+                    return elements
+            except Exception as e:
+                print(f"检查界面状态时出错: {e}")
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, max_interval)
+
+    def wait_for_any_text(self, texts: Tuple[str, ...], timeout: float = 10) -> List[UIElement]:
+        """等待文本包含任一给定字符串的元素出现（文本尚未出现时无需解析整个 dump）"""
+        return self._poll_elements(lambda: self.find_elements_by_any_text(texts), timeout)
+
+    def invalidate(self):
+        """使缓存的 UI 层次结构失效（界面已变化）"""
+        self._parsed_time = 0.0
+
+    def _refresh_xml(self) -> str:
+        """获取当前界面的原始 XML，短时间内重复调用时复用上一次的 dump"""
+        now = time.monotonic()
+        if self._xml is not None and now - self._parsed_time < self.cache_ttl:
+            return self._xml
+
+        # 设备上有比本地更新、且仍在有效期内的快照时，直接使用其中的 XML
+        snapshot = self.device._snapshot
+        if snapshot is not None and snapshot[0] > self._xml_time and now - snapshot[0] < self.cache_ttl:
+            now, xml_content = snapshot[0], snapshot[2]
+        else:
+            xml_content = self.device.dump_ui_hierarchy()
+        self._xml_time = now
+
+        xml_hash = hashlib.blake2b(xml_content.encode('utf-8'), digest_size=8).digest()
+
+        # 界面未变化时保留已解析的元素和查询结果
+        if xml_hash != self._xml_hash:
+            self._xml = xml_content
+            self._xml_hash = xml_hash
+            self._elements = None
+            self._query_cache = {}
+
+        self._parsed_time = now
+        return self._xml
+
+    def get_all_elements(self) -> List[UIElement]:
+        """获取当前界面的全部元素，短时间内重复调用时复用上一次的解析结果"""
+        xml_content = self._refresh_xml()
+        if self._elements is None:
+            self._elements = self._parse_elements_from_xml(xml_content)
+        return self._elements
+
+    def _find_elements(self, attr: str, value: str) -> List[UIElement]:
+        """在缓存的元素列表中按属性子串过滤"""
+        xml_content = self._refresh_xml()
+
+        key = (attr, value)
+        result = self._query_cache.get(key)
+        if result is None:
+            # 查询值不在文档中时直接判定无匹配，元素列表留到真正需要时再解析
+            if not _may_occur_in_xml(xml_content, value):
+                result = []
+            else:
+                result = [e for e in self.get_all_elements() if value in getattr(e, attr)]
+            self._query_cache[key] = result
+
+        return list(result)
+
+    def _parse_elements_from_xml(self, xml_content: Union[str, bytes],
                                 text_filter: str = None,
                                 resource_id_filter: str = None,
                                 class_filter: str = None) -> List[UIElement]:
-        """从 XML 解析 UI 元素"""
-        import xml.etree.ElementTree as ET
+        """从 XML 解析 UI 元素（流式解析，不构建 DOM 树）"""
+        elements = []
+        # 类名和 resource-id 在一次 dump 中大量重复，共享同一字符串对象以减少缓存占用
+        shared_strings: Dict[str, str] = {}
 
-        try:
-            root = ET.fromstring(xml_content)
-        except ET.ParseError as e:
-            raise Exception(f"UI XML 解析失败: {e}")
+        # 先用过滤器逐个检查对应属性，绝大多数节点只需一次属性查找就被排除
+        filters = [(attr, value) for attr, value in (('class', class_filter),
+                                                     ('resource-id', resource_id_filter),
+                                                     ('text', text_filter)) if value]
 
-        elements = []
+        # 过滤值在整个文档中都不存在时不可能有匹配，跳过解析
+        if not all(_may_occur_in_xml(xml_content, value) for _, value in filters):
+            return []
+
+        def start_element(name, attrs):
+            # 应用过滤器
+            for attr, value in filters:
+                if value not in attrs.get(attr, ''):
+                    return
+
+            # 只对通过过滤的节点提取其余属性
+            bounds_str = attrs.get('bounds')
+            if not bounds_str:
+                return
 
-        for node in root.iter():
-            # 提取属性
-            resource_id = node.get('resource-id', '')
-            text = node.get('text', '')
-            class_name = node.get('class', '')
-            bounds_str = node.get('bounds', '')
-            clickable = node.get('clickable', 'false') == 'true'
-            enabled = node.get('enabled', 'false') == 'true'
+            resource_id = attrs.get('resource-id', '')
+            text = attrs.get('text', '')
+            class_name = attrs.get('class', '')
 
             # 解析边界
             bounds = self._parse_bounds(bounds_str)
             if not bounds:
-                continue
-
-            # 应用过滤器
-            if text_filter and text_filter not in text:
-                continue
-            if resource_id_filter and resource_id_filter not in resource_id:
-                continue
-            if class_filter and class_filter not in class_name:
-                continue
+                return
 
             element = UIElement(
-                resource_id=resource_id,
+                resource_id=shared_strings.setdefault(resource_id, resource_id),
                 text=text,
-                class_name=class_name,
+                class_name=shared_strings.setdefault(class_name, class_name),
                 bounds=bounds,
-                clickable=clickable,
-                enabled=enabled
+                clickable=attrs.get('clickable', 'false') == 'true',
+                enabled=attrs.get('enabled', 'false') == 'true'
             )
             elements.append(element)
 
+        parser = expat.ParserCreate()
+        parser.StartElementHandler = start_element
+
+        try:
+            parser.Parse(xml_content, True)
+        except expat.ExpatError as e:
+            raise Exception(f"UI XML 解析失败: {e}")
+
         return elements
 
     def _parse_bounds(self, bounds_str: str) -> Optional[Tuple[int, int, int, int]]:
@@ -223,8 +626,7 @@ class UIAnalyzer:
         if not bounds_str:
             return None
 
-        pattern = r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]'
-        match = re.match(pattern, bounds_str)
+        match = _BOUNDS_RE.match(bounds_str)
         if match:
             return tuple(map(int, match.groups()))
         return None
@@ -6,23 +6,227 @@ Image-based UI Element Recognition
 import cv2
 import numpy as np
 from PIL import Image
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+
+# OpenCV 的线程数是进程级设置，并行匹配期间按引用计数临时改为单线程
+_cv_threads_lock = threading.Lock()
+_cv_threads_users = 0
+_cv_threads_saved = 0
+
+
+@contextmanager
+def _opencv_single_threaded():
+    """在上下文内关闭 OpenCV 内部多线程；可被多个线程同时进入，最后一个退出时恢复原设置"""
+    global _cv_threads_users, _cv_threads_saved
+    with _cv_threads_lock:
+        if _cv_threads_users == 0:
+            _cv_threads_saved = cv2.getNumThreads()
+            cv2.setNumThreads(1)
+        _cv_threads_users += 1
+    try:
+        yield
+    finally:
+        with _cv_threads_lock:
+            _cv_threads_users -= 1
+            if _cv_threads_users == 0:
+                cv2.setNumThreads(_cv_threads_saved)
+
+
+@lru_cache(maxsize=128)
+def _load_template_pyramid(template_path: str, mtime: float, levels: int,
+                           min_size: int, min_fidelity: float) -> List[np.ndarray]:
+    """
+    读取模板并构建高斯金字塔
+
+    mtime 参与缓存键，模板文件被覆盖后会自动重新读取；
+    缓存在模块级别，多个 ImageMatcher 实例共享同一份解码结果
+    """
+    # 模板以灰度读取，单通道匹配的计算量和内存带宽只有三通道的 1/3
+    template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
+    if template is None:
+        raise ValueError(f"无法读取模板图片: {template_path}")
+
+    pyramid = [template]
+    for _ in range(levels):
+        if min(pyramid[-1].shape[:2]) // 2 < min_size:
+            break
+
+        # 细节丰富的模板缩小后失真严重，粗层得分不可靠，此时不再继续降采样
+        smaller = cv2.pyrDown(pyramid[-1])
+        height, width = pyramid[-1].shape[:2]
+        restored = cv2.pyrUp(smaller, dstsize=(width, height))
+        fidelity = cv2.matchTemplate(restored, pyramid[-1], cv2.TM_CCOEFF_NORMED)[0, 0]
+        if fidelity < min_fidelity:
+            break
+
+        pyramid.append(smaller)
+
+    # 缓存的数组在多处共享，设为只读防止被意外修改
+    for level in pyramid:
+        level.flags.writeable = False
+    return pyramid
 
 
 class ImageMatcher:
     """图像匹配器 - 用于在屏幕截图中查找UI元素"""
 
-    def __init__(self, confidence_threshold: float = 0.8):
+    # 金字塔匹配参数
+    MIN_PYRAMID_TEMPLATE_SIZE = 8  # 最粗层模板的最小边长（像素）
+    PYRAMID_CANDIDATES = 3  # 最粗层保留的候选峰值数
+    PYRAMID_MIN_FIDELITY = 0.9  # 模板降采样再还原后与原图的最低相似度
+
+    # OCR 参数: 界面文字稀疏，用 sparse text 模式跳过整页版面分析，只用 LSTM 引擎
+    OCR_CONFIG = '--psm 11 --oem 1'
+
+    def __init__(self, confidence_threshold: float = 0.8,
+                 pyramid_levels: int = 2, pyramid_margin: float = 0.2,
+                 use_gpu: Optional[str] = None):
+        """
+        Args:
+            confidence_threshold: 匹配置信度阈值
+            pyramid_levels: 由粗到细匹配的金字塔层数，0 表示只在原分辨率匹配
+            pyramid_margin: 粗层筛选候选时相对阈值的放宽量
+            use_gpu: 整图匹配使用的 GPU 后端，'opencl'、'cuda' 或 None（CPU）；
+                     不可用时自动回退到 CPU
+        """
         self.confidence_threshold = confidence_threshold
+        self.pyramid_levels = pyramid_levels
+        self.pyramid_margin = pyramid_margin
+        self._last_match: Dict[str, Tuple[int, int]] = {}  # 模板上次匹配到的左上角坐标
+
+        self.gpu_backend = self._init_gpu_backend(use_gpu)
+        self._cuda_matcher = None
+        self._cuda_lock = threading.Lock()
+        if self.gpu_backend == 'cuda':
+            self._cuda_matcher = cv2.cuda.createTemplateMatching(cv2.CV_8UC1, cv2.TM_CCOEFF_NORMED)
+
+    @staticmethod
+    def _init_gpu_backend(use_gpu: Optional[str]) -> Optional[str]:
+        """检查请求的 GPU 后端是否可用"""
+        if use_gpu is None:
+            return None
+
+        if use_gpu == 'opencl':
+            if cv2.ocl.haveOpenCL():
+                cv2.ocl.setUseOpenCL(True)
+                return 'opencl'
+        elif use_gpu == 'cuda':
+            if hasattr(cv2, 'cuda') and cv2.cuda.getCudaEnabledDeviceCount() > 0:
+                return 'cuda'
+        else:
+            raise ValueError(f"不支持的 GPU 后端: {use_gpu}")
+
+        print(f"警告: {use_gpu} 不可用，模板匹配使用 CPU")
+        return None
+
+    def _match_template(self, image: np.ndarray, template: np.ndarray) -> np.ndarray:
+        """整图模板匹配，按配置分派到 CPU / OpenCL / CUDA，返回得分图"""
+        if self.gpu_backend == 'opencl':
+            # T-API: UMat 输入会让 matchTemplate 自动走 OpenCL 内核
+            return cv2.matchTemplate(cv2.UMat(image), cv2.UMat(template), cv2.TM_CCOEFF_NORMED).get()
+
+        if self.gpu_backend == 'cuda':
+            gpu_image = cv2.cuda_GpuMat()
+            gpu_image.upload(image)
+            gpu_template = cv2.cuda_GpuMat()
+            gpu_template.upload(template)
+            # CUDA 匹配器对象不是线程安全的
+            with self._cuda_lock:
+                return self._cuda_matcher.match(gpu_image, gpu_template).download()
+
+        return cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+
+    def _load_template_pyramid(self, template_path: str) -> List[np.ndarray]:
+        """读取模板并构建高斯金字塔（按路径和修改时间缓存）"""
+        return _load_template_pyramid(template_path, os.path.getmtime(template_path),
+                                      self.pyramid_levels, self.MIN_PYRAMID_TEMPLATE_SIZE,
+                                      self.PYRAMID_MIN_FIDELITY)
+
+    @staticmethod
+    def _to_gray(screenshot: Union[Image.Image, np.ndarray]) -> np.ndarray:
+        """
+        将截图一次性转换为单通道灰度数组
+
+        截图可以是 PIL 图像，也可以是 RGB/RGBA 或已转好的灰度 ndarray；
+        直接按 RGB 顺序转灰度，不经过 BGR 中转
+        """
+        arr = np.asarray(screenshot)
+        if arr.ndim == 2:
+            return arr
+        code = cv2.COLOR_RGBA2GRAY if arr.shape[2] == 4 else cv2.COLOR_RGB2GRAY
+        return cv2.cvtColor(arr, code)
+
+    def _coarse_match(self, screenshot_cv: np.ndarray,
+                      pyramid: List[np.ndarray]) -> Tuple[np.ndarray, int]:
+        """在金字塔最粗层上做全图匹配，返回 (得分图, 缩放倍数)"""
+        levels = len(pyramid) - 1
+        screen_small = screenshot_cv
+        for _ in range(levels):
+            screen_small = cv2.pyrDown(screen_small)
+        result = self._match_template(screen_small, pyramid[-1])
+        return result, 1 << levels
+
+    def _refine_match(self, screenshot_cv: np.ndarray, template: np.ndarray,
+                      coarse_x: int, coarse_y: int, scale: int) -> Tuple[float, Tuple[int, int]]:
+        """在原分辨率下、粗层候选点附近的小窗口内精确匹配"""
+        pad = 2 * scale  # 坐标映射回原分辨率时的误差余量
+        screen_height, screen_width = screenshot_cv.shape[:2]
+        template_height, template_width = template.shape[:2]
 
-    def find_element_by_template(self, screenshot: Image.Image,
+        x0 = max(coarse_x * scale - pad, 0)
+        y0 = max(coarse_y * scale - pad, 0)
+        x1 = min(coarse_x * scale + template_width + pad, screen_width)
+        y1 = min(coarse_y * scale + template_height + pad, screen_height)
+        roi = screenshot_cv[y0:y1, x0:x1]
+
+        if roi.shape[0] < template_height or roi.shape[1] < template_width:
+            return -1.0, (0, 0)
+
+        fine = cv2.matchTemplate(roi, template, cv2.TM_CCOEFF_NORMED)
+        _, fine_val, _, fine_loc = cv2.minMaxLoc(fine)
+        return fine_val, (x0 + fine_loc[0], y0 + fine_loc[1])
+
+    def _match_pyramid(self, screenshot_cv: np.ndarray,
+                       pyramid: List[np.ndarray]) -> Tuple[float, Tuple[int, int]]:
+        """由粗到细的模板匹配，返回 (最佳得分, 左上角坐标)"""
+        template = pyramid[0]
+
+        if len(pyramid) == 1:
+            result = self._match_template(screenshot_cv, template)
+            _, max_val, _, max_loc = cv2.minMaxLoc(result)
+            return max_val, max_loc
+
+        result, scale = self._coarse_match(screenshot_cv, pyramid)
+        small_height, small_width = pyramid[-1].shape[:2]
+
+        best_val, best_loc = -1.0, (0, 0)
+        for _ in range(self.PYRAMID_CANDIDATES):
+            _, coarse_val, _, (cx, cy) = cv2.minMaxLoc(result)
+            if coarse_val < self.confidence_threshold - self.pyramid_margin:
+                break
+
+            fine_val, fine_loc = self._refine_match(screenshot_cv, template, cx, cy, scale)
+            if fine_val > best_val:
+                best_val, best_loc = fine_val, fine_loc
+
+            # 抑制该峰值附近区域，继续寻找下一个候选
+            result[max(cy - small_height // 2, 0):cy + small_height // 2 + 1,
+                   max(cx - small_width // 2, 0):cx + small_width // 2 + 1] = -1.0
+
+        return best_val, best_loc
+
+    def find_element_by_template(self, screenshot: Union[Image.Image, np.ndarray],
                                 template_path: str) -> Optional[Tuple[int, int, int, int]]:
         """
         使用模板匹配在截图中查找元素
 
         Args:
-            screenshot: 屏幕截图
+            screenshot: 屏幕截图（PIL 图像或 ndarray）
             template_path: 模板图片路径
 
         Returns:
@@ -31,21 +235,23 @@ class ImageMatcher:
         if not os.path.exists(template_path):
             raise FileNotFoundError(f"模板图片不存在: {template_path}")
 
-        # 转换为 OpenCV 格式
-        screenshot_cv = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-        template = cv2.imread(template_path)
-
-        if template is None:
-            raise ValueError(f"无法读取模板图片: {template_path}")
+        # 转换为 OpenCV 灰度格式
+        screenshot_cv = self._to_gray(screenshot)
+        pyramid = self._load_template_pyramid(template_path)
 
         # 获取模板尺寸
-        template_height, template_width = template.shape[:2]
+        template_height, template_width = pyramid[0].shape[:2]
 
-        # 模板匹配
-        result = cv2.matchTemplate(screenshot_cv, template, cv2.TM_CCOEFF_NORMED)
+        # 快速路径: 元素仍在上次的位置且像素完全一致时，无需相关运算
+        last_loc = self._last_match.get(template_path)
+        if last_loc is not None:
+            left, top = last_loc
+            region = screenshot_cv[top:top + template_height, left:left + template_width]
+            if np.array_equal(region, pyramid[0]):
+                return (left, top, left + template_width, top + template_height)
 
-        # 查找最佳匹配
-        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+        # 由粗到细的模板匹配
+        max_val, max_loc = self._match_pyramid(screenshot_cv, pyramid)
 
         if max_val >= self.confidence_threshold:
             # 计算边界
@@ -54,86 +260,133 @@ class ImageMatcher:
             right = left + template_width
             bottom = top + template_height
 
+            self._last_match[template_path] = (left, top)
             return (left, top, right, bottom)
 
         return None
 
-    def find_all_elements_by_template(self, screenshot: Image.Image,
+    def find_any(self, screenshot: Union[Image.Image, np.ndarray],
+                 template_paths: List[str]) -> Optional[Tuple[str, Tuple[int, int, int, int]]]:
+        """
+        并行匹配多个模板，返回列表中最靠前的命中项
+
+        Args:
+            screenshot: 屏幕截图（PIL 图像或 ndarray）
+            template_paths: 按优先级排列的模板路径
+
+        Returns:
+            (模板路径, 元素边界) 或 None
+        """
+        if not template_paths:
+            return None
+
+        for template_path in template_paths:
+            if not os.path.exists(template_path):
+                raise FileNotFoundError(f"模板图片不存在: {template_path}")
+
+        # 截图只转换一次，各线程共享同一份只读灰度数组
+        screenshot_cv = self._to_gray(screenshot)
+        if len(template_paths) == 1:
+            bounds = self.find_element_by_template(screenshot_cv, template_paths[0])
+            return (template_paths[0], bounds) if bounds else None
+
+        # matchTemplate 执行时释放 GIL，由外层线程池并行；
+        # 期间关闭 OpenCV 内部多线程，避免线程数超额
+        with _opencv_single_threaded():
+            executor = ThreadPoolExecutor(max_workers=min(len(template_paths), os.cpu_count() or 1))
+            try:
+                futures = [executor.submit(self.find_element_by_template, screenshot_cv, path)
+                           for path in template_paths]
+                for template_path, future in zip(template_paths, futures):
+                    bounds = future.result()
+                    if bounds:
+                        return template_path, bounds
+                return None
+            finally:
+                # 已命中时不再等待优先级更低的模板
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def find_all_elements_by_template(self, screenshot: Union[Image.Image, np.ndarray],
                                      template_path: str) -> List[Tuple[int, int, int, int]]:
         """查找所有匹配的元素"""
         if not os.path.exists(template_path):
             raise FileNotFoundError(f"模板图片不存在: {template_path}")
 
-        screenshot_cv = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-        template = cv2.imread(template_path)
+        screenshot_cv = self._to_gray(screenshot)
+        pyramid = self._load_template_pyramid(template_path)
+        template = pyramid[0]
         template_height, template_width = template.shape[:2]
 
-        result = cv2.matchTemplate(screenshot_cv, template, cv2.TM_CCOEFF_NORMED)
-
-        # 查找所有高于阈值的匹配
-        locations = np.where(result >= self.confidence_threshold)
+        if len(pyramid) == 1:
+            result = self._match_template(screenshot_cv, template)
 
-        elements = []
-        for pt in zip(*locations[::-1]):  # OpenCV 返回的是 (y, x)，需要转换
-            left = pt[0]
-            top = pt[1]
-            right = left + template_width
-            bottom = top + template_height
-            elements.append((left, top, right, bottom))
+            # 查找所有高于阈值的匹配，OpenCV 返回的是 (y, x)
+            ys, xs = np.nonzero(result >= self.confidence_threshold)
+            scores = result[ys, xs]
+        else:
+            # 在最粗层找出候选点，先做一次抑制，使每个峰值只在原分辨率精确匹配一次
+            coarse, scale = self._coarse_match(screenshot_cv, pyramid)
+            small_height, small_width = pyramid[-1].shape[:2]
+            # 只保留 3x3 邻域内的局部极大值，避免低阈值时候选点过多
+            local_max = coarse == cv2.dilate(coarse, np.ones((3, 3), np.uint8))
+            ys, xs = np.nonzero(local_max & (coarse >= self.confidence_threshold - self.pyramid_margin))
+            peaks = self._remove_overlapping_boxes(
+                np.stack([xs, ys, xs + small_width, ys + small_height], axis=1), coarse[ys, xs]
+            )
+
+            refined = [self._refine_match(screenshot_cv, template, x, y, scale) for x, y, _, _ in peaks]
+            refined = [(val, loc) for val, loc in refined if val >= self.confidence_threshold]
+            scores = np.array([val for val, _ in refined], dtype=np.float32)
+            xs = np.array([loc[0] for _, loc in refined], dtype=np.int64)
+            ys = np.array([loc[1] for _, loc in refined], dtype=np.int64)
+
+        boxes = np.stack([xs, ys, xs + template_width, ys + template_height], axis=1)
 
         # 去除重叠的检测结果
-        return self._remove_overlapping_boxes(elements)
+        return self._remove_overlapping_boxes(boxes, scores)
 
-    def _remove_overlapping_boxes(self, boxes: List[Tuple[int, int, int, int]],
+    def _remove_overlapping_boxes(self, boxes: np.ndarray, scores: np.ndarray,
                                  overlap_threshold: float = 0.5) -> List[Tuple[int, int, int, int]]:
-        """移除重叠的检测框"""
-        if not boxes:
-            return []
-
-        # 按置信度排序（这里简化处理，实际可以加入置信度信息）
-        boxes = sorted(boxes, key=lambda x: (x[0], x[1]))
-
-        filtered_boxes = []
-        for box in boxes:
-            is_overlapping = False
-            for existing_box in filtered_boxes:
-                if self._calculate_overlap(box, existing_box) > overlap_threshold:
-                    is_overlapping = True
-                    break
-
-            if not is_overlapping:
-                filtered_boxes.append(box)
-
-        return filtered_boxes
+        """
+        按匹配得分从高到低做非极大值抑制，移除 IoU 超过阈值的检测框
 
-    def _calculate_overlap(self, box1: Tuple[int, int, int, int],
-                          box2: Tuple[int, int, int, int]) -> float:
-        """计算两个框的重叠比例"""
-        x1_left, y1_top, x1_right, y1_bottom = box1
-        x2_left, y2_top, x2_right, y2_bottom = box2
+        Args:
+            boxes: (N, 4) 数组，每行为 (left, top, right, bottom)
+            scores: (N,) 匹配得分
+        """
+        if not len(boxes):
+            return []
 
-        # 计算交集
-        intersection_left = max(x1_left, x2_left)
-        intersection_top = max(y1_top, y2_top)
-        intersection_right = min(x1_right, x2_right)
-        intersection_bottom = min(y1_bottom, y2_bottom)
+        left, top, right, bottom = boxes.T
+        areas = (right - left) * (bottom - top)
+        order = np.argsort(-scores, kind='stable')
 
-        if intersection_right <= intersection_left or intersection_bottom <= intersection_top:
-            return 0.0
+        keep = []
+        while order.size:
+            i = order[0]
+            keep.append(i)
+            rest = order[1:]
 
-        intersection_area = (intersection_right - intersection_left) * (intersection_bottom - intersection_top)
+            # 当前框与剩余所有框的 IoU，一次向量化计算
+            inter_w = np.clip(np.minimum(right[i], right[rest]) - np.maximum(left[i], left[rest]), 0, None)
+            inter_h = np.clip(np.minimum(bottom[i], bottom[rest]) - np.maximum(top[i], top[rest]), 0, None)
+            inter = inter_w * inter_h
+            union = areas[i] + areas[rest] - inter
+            iou = np.divide(inter, union, out=np.zeros(len(rest)), where=union > 0)
 
-        # 计算并集
-        box1_area = (x1_right - x1_left) * (y1_bottom - y1_top)
-        box2_area = (x2_right - x2_left) * (y2_bottom - y2_top)
-        union_area = box1_area + box2_area - intersection_area
+            order = rest[iou <= overlap_threshold]
 
-        return intersection_area / union_area if union_area > 0 else 0.0
+        return [tuple(int(v) for v in boxes[i]) for i in keep]
 
-    def find_text_by_ocr(self, screenshot: Image.Image, target_text: str) -> List[Tuple[int, int, int, int]]:
+    def find_text_by_ocr(self, screenshot: Union[Image.Image, np.ndarray], target_text: str,
+                         downscale: int = 1) -> List[Tuple[int, int, int, int]]:
         """
         使用 OCR 查找文本元素
         注意: 需要安装 pytesseract 和 tesseract
+
+        Args:
+            downscale: 识别前的缩小倍数。只在目标文字足够大（缩小后字高仍约 20px 以上）
+                       时使用，时间戳、角标等小字缩小后会识别不到；默认不缩小
         """
         try:
             import pytesseract
@@ -141,25 +394,34 @@ class ImageMatcher:
             print("警告: pytesseract 未安装，无法使用 OCR 功能")
             return []
 
-        # 转换为灰度图像
-        screenshot_cv = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-        gray = cv2.cvtColor(screenshot_cv, cv2.COLOR_BGR2GRAY)
+        # 转换为灰度图像（按需缩小）后二值化，tesseract 不必再做内部阈值处理
+        gray = self._to_gray(screenshot)
+        scale = max(int(downscale), 1)
+        if scale > 1:
+            gray = cv2.resize(gray, (gray.shape[1] // scale, gray.shape[0] // scale),
+                              interpolation=cv2.INTER_AREA)
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+
+        # 目标文本全是 ASCII 时不加载中文模型，可省去每次调用约 200ms 的初始化
+        lang = 'eng' if target_text.isascii() else 'chi_sim+eng'
 
         # 使用 OCR 检测文本
         try:
-            data = pytesseract.image_to_data(gray, output_type=pytesseract.Output.DICT, lang='chi_sim+eng')
+            data = pytesseract.image_to_data(binary, output_type=pytesseract.Output.DICT,
+                                             lang=lang, config=self.OCR_CONFIG)
 
-            elements = []
-            for i, text in enumerate(data['text']):
-                if target_text in text and int(data['conf'][i]) > 50:  # 置信度大于50
-                    left = data['left'][i]
-                    top = data['top'][i]
-                    width = data['width'][i]
-                    height = data['height'][i]
+            # 置信度大于50 且包含目标文本的结果，用布尔掩码一次筛出
+            texts = data['text']
+            confs = np.asarray(data['conf'], dtype=np.float32)
+            mask = (confs > 50) & np.fromiter((target_text in text for text in texts), bool, len(texts))
 
-                    elements.append((left, top, left + width, top + height))
+            # 坐标映射回原分辨率
+            left = np.asarray(data['left'])[mask] * scale
+            top = np.asarray(data['top'])[mask] * scale
+            right = left + np.asarray(data['width'])[mask] * scale
+            bottom = top + np.asarray(data['height'])[mask] * scale
 
-            return elements
+            return [tuple(int(v) for v in box) for box in zip(left, top, right, bottom)]
 
         except Exception as e:
             print(f"OCR 处理失败: {e}")
@@ -186,8 +448,8 @@ class WeChatImageAutomation:
             print(f"警告: 模板图片不存在 {template_path}")
             return False
 
-        # 截屏
-        screenshot = self.device.take_screenshot()
+        # 截屏（直接使用原始帧缓冲数组，省去 PIL 封装）
+        screenshot = self.device.take_screenshot_array(reuse_buffer=True)
 
         # 查找元素
         element_bounds = self.matcher.find_element_by_template(screenshot, template_path)
@@ -199,6 +461,8 @@ class WeChatImageAutomation:
 
             # 点击元素
             self.device.tap(center_x, center_y)
+            # tap 不再附带固定延时，等界面稳定后再返回
+            self.device.wait_for_idle()
             print(f"✅ 通过图像模板点击: {template_name}")
             return True
         else:
@@ -215,16 +479,21 @@ class WeChatImageAutomation:
 
         import time
         start_time = time.time()
+        delay = 0.1  # 轮询间隔从 100ms 开始按 1.5 倍增长，最长 1 秒
 
         while time.time() - start_time < timeout:
-            screenshot = self.device.take_screenshot()
+            screenshot = self.device.take_screenshot_array(reuse_buffer=True)
             element_bounds = self.matcher.find_element_by_template(screenshot, template_path)
 
             if element_bounds:
                 print(f"✅ 图像元素已出现: {template_name}")
                 return True
 
-            time.sleep(1)
+            remaining = timeout - (time.time() - start_time)
+            if remaining <= 0:
+                break
+            time.sleep(min(delay, remaining))
+            delay = min(1.0, delay * 1.5)
 
         print(f"❌ 等待图像元素超时: {template_name}")
         return False
@@ -246,27 +515,35 @@ class WeChatImageAutomation:
 
     def analyze_current_screen(self, save_path: str = "screen_analysis.png"):
         """分析当前屏幕并保存标注图片"""
-        screenshot = self.device.take_screenshot()
-        screenshot_cv = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-
-        # 使用边缘检测找到可能的UI元素
-        gray = cv2.cvtColor(screenshot_cv, cv2.COLOR_BGR2GRAY)
-        edges = cv2.Canny(gray, 50, 150)
-
-        # 查找轮廓
-        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        # 绘制轮廓和边界框
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if 100 < area < 50000:  # 过滤太小或太大的区域
-                x, y, w, h = cv2.boundingRect(contour)
-                cv2.rectangle(screenshot_cv, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                cv2.putText(screenshot_cv, f"Area:{int(area)}", (x, y - 10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+        screenshot = self.device.take_screenshot_array(reuse_buffer=True)
+        gray = ImageMatcher._to_gray(screenshot)
+        # 标注直接画在 RGB 视图的连续副本上，保存时交给 PIL，无需转换为 BGR
+        canvas = np.ascontiguousarray(screenshot[..., :3])
+
+        # 布局边界不需要像素级精度，在半分辨率上检测
+        small = cv2.pyrDown(gray)
+        scale = 2
+
+        # Otsu 二值化后求连通域，直接得到每个区域的外接矩形和面积；
+        # 取占少数的一侧作为前景，背景不会被当成一个巨大的区域
+        _, binary = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        if cv2.countNonZero(binary) * 2 > binary.size:
+            binary = cv2.bitwise_not(binary)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+
+        # 跳过背景标签 0，按原分辨率面积过滤太小或太大的区域
+        stats = stats[1:] * np.array([scale, scale, scale, scale, scale * scale])
+        areas = stats[:, cv2.CC_STAT_AREA]
+        regions = stats[(areas > 100) & (areas < 50000)]
+
+        # 绘制边界框
+        for x, y, w, h, area in regions:
+            cv2.rectangle(canvas, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            cv2.putText(canvas, f"Area:{int(area)}", (x, y - 10),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
 
         # 保存分析结果
-        cv2.imwrite(save_path, screenshot_cv)
+        Image.fromarray(canvas).save(save_path)
         print(f"✅ 屏幕分析完成: {save_path}")
 
         return save_path
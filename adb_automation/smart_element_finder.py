@@ -4,20 +4,31 @@ Smart Element Finder with Caching
 """
 
 import time
-import json
+import pickle
+import atexit
 import hashlib
+import io
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Optional, Tuple, Union
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from PIL import Image
+import numpy as np
 import os
 
 from .core import AndroidDevice, UIAnalyzer, UIElement
 from .image_recognition import ImageMatcher
 
+# resource_id 形如 "com.tencent.mm:id/xxx"
+_RESOURCE_ID_RE = re.compile(r"[^:]+:[^/]+/")
+
 
 @dataclass
 class CachedElement:
     """缓存的元素信息"""
+    __slots__ = ('resource_id', 'bounds', 'text', 'class_name',
+                 'timestamp', 'confidence', 'method')
+
     resource_id: str
     bounds: Tuple[int, int, int, int]
     text: str
@@ -30,31 +41,45 @@ class CachedElement:
 class SmartElementFinder:
     """智能元素查找器 - 优先使用快速方法，必要时才使用图像识别"""
 
+    IO_BUFFER_SIZE = 1 << 16  # 缓存文件读写缓冲区大小
+
     def __init__(self, device: AndroidDevice, cache_dir: str = "element_cache"):
         self.device = device
         self.analyzer = UIAnalyzer(device)
         self.image_matcher = ImageMatcher()
         self.cache_dir = cache_dir
-        self.cache_file = os.path.join(cache_dir, "element_cache.json")
-        self.element_cache: Dict[str, CachedElement] = {}
+        self.cache_file = os.path.join(cache_dir, "element_cache.pkl")
+        self.element_cache: Dict[Tuple[str, str], CachedElement] = {}
 
         # 缓存配置
         self.cache_ttl = 300  # 缓存5分钟
         self.image_cache_ttl = 60  # 图像缓存1分钟（更短，因为UI变化频繁）
+        self.flush_interval = 5.0  # 缓存写盘的最小间隔（秒）
+
+        # UI 快照，供连续的缓存验证共享同一次 dump
+        self._ui_snapshot: Optional[List[UIElement]] = None
+        self._bounds_arr = np.empty((0, 4), dtype=np.int32)
+
+        # 延迟写盘状态
+        self._dirty = False
+        self._last_flush = time.monotonic()
 
         # 创建缓存目录
         os.makedirs(cache_dir, exist_ok=True)
         self._load_cache()
 
+        # 进程退出时写回未保存的缓存
+        atexit.register(self.flush_cache)
+
     def _load_cache(self):
         """加载缓存"""
         if os.path.exists(self.cache_file):
             try:
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    cache_data = json.load(f)
+                with open(self.cache_file, 'rb', buffering=self.IO_BUFFER_SIZE) as f:
+                    rows = pickle.loads(f.read())
 
-                for key, data in cache_data.items():
-                    self.element_cache[key] = CachedElement(**data)
+                # 每条缓存以字段顺序的元组存储
+                self.element_cache = {key: CachedElement(*row) for key, row in rows.items()}
 
                 print(f"📚 加载了 {len(self.element_cache)} 个缓存元素")
             except Exception as e:
@@ -63,15 +88,32 @@ class SmartElementFinder:
     def _save_cache(self):
         """保存缓存"""
         try:
-            cache_data = {}
-            for key, element in self.element_cache.items():
-                cache_data[key] = asdict(element)
-
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, ensure_ascii=False, indent=2)
+            # 先在内存中序列化，再一次性写入文件
+            # 直接读取字段组成元组，避免 asdict 的递归深拷贝
+            rows = {
+                key: (e.resource_id, e.bounds, e.text, e.class_name,
+                      e.timestamp, e.confidence, e.method)
+                for key, e in self.element_cache.items()
+            }
+            buf = io.BytesIO()
+            pickle.dump(rows, buf, protocol=5)
+
+            # 写入临时文件后原子替换，中断时不会留下损坏的缓存文件
+            tmp_file = self.cache_file + ".tmp"
+            with open(tmp_file, 'wb', buffering=self.IO_BUFFER_SIZE) as f:
+                f.write(buf.getbuffer())
+            os.replace(tmp_file, self.cache_file)
+
+            self._dirty = False
+            self._last_flush = time.monotonic()
         except Exception as e:
             print(f"⚠️ 缓存保存失败: {e}")
 
+    def flush_cache(self):
+        """将未保存的缓存写入磁盘"""
+        if self._dirty:
+            self._save_cache()
+
     def _is_cache_valid(self, element: CachedElement) -> bool:
         """检查缓存是否仍然有效"""
         current_time = time.time()
@@ -84,9 +126,9 @@ class SmartElementFinder:
 
         return (current_time - element.timestamp) < ttl
 
-    def _generate_cache_key(self, identifier: str, method: str) -> str:
-        """生成缓存键"""
-        return f"{method}:{identifier}"
+    def _generate_cache_key(self, identifier: str, method: str) -> Tuple[str, str]:
+        """生成缓存键 (method, identifier)"""
+        return (method, identifier)
 
     def find_element(self, identifier: str,
                     method: str = "auto",
@@ -120,6 +162,7 @@ class SmartElementFinder:
                 else:
                     print(f"🗑️ 缓存元素已失效，删除缓存: {identifier}")
                     del self.element_cache[cache_key]
+                    self._dirty = True
 
         # 2. 根据方法查找元素
         element = None
@@ -148,9 +191,8 @@ class SmartElementFinder:
     def _auto_find_element(self, identifier: str,
                           template_path: str = None) -> Tuple[Optional[UIElement], str]:
         """自动选择最佳查找方法"""
-
         # 策略1: 如果identifier看起来像resource_id，先尝试resource_id
-        if ":" in identifier and "/" in identifier:
+        if _RESOURCE_ID_RE.match(identifier):
             print("🎯 尝试 resource_id 方法...")
             element = self._find_by_resource_id(identifier)
             if element:
@@ -162,12 +204,27 @@ class SmartElementFinder:
         if element:
             return element, "text"
 
-        # 策略3: 如果有模板路径，尝试图像匹配
+        # 策略3: 如果有模板路径，图像匹配与 OCR 共用一张截图并行执行，先命中者胜出
         if template_path and os.path.exists(template_path):
-            print("🎯 尝试图像匹配...")
-            element = self._find_by_image(template_path)
-            if element:
-                return element, "image"
+            print("🎯 并行尝试图像匹配和 OCR 文字识别...")
+            # 两个任务只读共享同一份原始帧数组
+            screenshot = self.device.take_screenshot_array()
+
+            executor = ThreadPoolExecutor(max_workers=2)
+            try:
+                futures = {
+                    executor.submit(self._find_by_image, template_path, screenshot): "image",
+                    executor.submit(self._find_by_ocr, identifier, screenshot): "ocr",
+                }
+                for future in as_completed(futures):
+                    element = future.result()
+                    if element:
+                        return element, futures[future]
+            finally:
+                # 不等待仍在运行的任务
+                executor.shutdown(wait=False, cancel_futures=True)
+
+            return None, "none"
 
         # 策略4: 最后尝试OCR (最慢)
         print("🎯 尝试 OCR 文字识别...")
@@ -187,12 +244,14 @@ class SmartElementFinder:
         elements = self.analyzer.find_elements_by_text(text)
         return elements[0] if elements else None
 
-    def _find_by_image(self, template_path: str) -> Optional[UIElement]:
+    def _find_by_image(self, template_path: str,
+                       screenshot: Optional[np.ndarray] = None) -> Optional[UIElement]:
         """通过图像模板查找"""
         if not os.path.exists(template_path):
             return None
 
-        screenshot = self.device.take_screenshot()
+        if screenshot is None:
+            screenshot = self.device.take_screenshot_array()
         bounds = self.image_matcher.find_element_by_template(screenshot, template_path)
 
         if bounds:
@@ -206,10 +265,11 @@ class SmartElementFinder:
             )
         return None
 
-    def _find_by_ocr(self, text: str) -> Optional[UIElement]:
+    def _find_by_ocr(self, text: str, screenshot: Optional[np.ndarray] = None) -> Optional[UIElement]:
         """通过OCR查找"""
         try:
-            screenshot = self.device.take_screenshot()
+            if screenshot is None:
+                screenshot = self.device.take_screenshot_array()
             bounds_list = self.image_matcher.find_text_by_ocr(screenshot, text)
 
             if bounds_list:
@@ -230,24 +290,47 @@ class SmartElementFinder:
         """验证缓存的元素是否仍然存在"""
         try:
             # 快速验证：检查该位置是否还有可点击元素
-            left, top, right, bottom = cached.bounds
-            center_x = (left + right) // 2
-            center_y = (top + bottom) // 2
-
             # 获取当前UI状态
-            xml_content = self.device.dump_ui_hierarchy()
-            all_elements = self.analyzer._parse_elements_from_xml(xml_content)
+            self._get_ui_snapshot()
 
             # 检查是否有元素在相同位置
-            for element in all_elements:
-                if element.bounds and self._bounds_overlap(element.bounds, cached.bounds):
-                    return True
+            return self._any_bounds_overlap(cached.bounds)
 
+        except Exception:
             return False
 
-        except Exception:
+    def _get_ui_snapshot(self) -> List[UIElement]:
+        """获取当前 UI 元素列表（复用 UIAnalyzer 的解析缓存）"""
+        elements = self.analyzer.get_all_elements()
+
+        # 界面变化后重建边界数组
+        if elements is not self._ui_snapshot:
+            self._ui_snapshot = elements
+            self._bounds_arr = np.asarray(
+                [e.bounds for e in elements if e.bounds], dtype=np.int32
+            ).reshape(-1, 4)
+
+        return elements
+
+    def _any_bounds_overlap(self, bounds: Tuple[int, int, int, int],
+                            threshold: float = 0.8) -> bool:
+        """向量化检查快照中是否有元素与给定边界重叠（语义同 _bounds_overlap）"""
+        arr = self._bounds_arr
+        if not len(arr):
             return False
 
+        overlap_lt = np.maximum(arr[:, :2], bounds[:2])
+        overlap_rb = np.minimum(arr[:, 2:], bounds[2:])
+        overlap_wh = overlap_rb - overlap_lt
+        overlap_area = np.where((overlap_wh > 0).all(axis=1),
+                                overlap_wh[:, 0] * overlap_wh[:, 1], 0)
+
+        element_wh = arr[:, 2:] - arr[:, :2]
+        element_area = element_wh[:, 0] * element_wh[:, 1]
+
+        hits = (overlap_area > 0) & (overlap_area >= threshold * element_area)
+        return bool(hits.any())
+
     def _bounds_overlap(self, bounds1: Tuple[int, int, int, int],
                        bounds2: Tuple[int, int, int, int], threshold: float = 0.8) -> bool:
         """检查两个边界是否重叠"""
@@ -283,7 +366,11 @@ class SmartElementFinder:
         )
 
         self.element_cache[cache_key] = cached_element
-        self._save_cache()
+        self._dirty = True
+
+        # 限制写盘频率，避免每次查找都重写整个缓存文件
+        if time.monotonic() - self._last_flush > self.flush_interval:
+            self._save_cache()
         print(f"💾 缓存元素: {identifier} (方法: {method})")
 
     def click_element(self, identifier: str, **kwargs) -> bool:
@@ -293,6 +380,8 @@ class SmartElementFinder:
         if element:
             center_x, center_y = self.analyzer.get_element_center(element)
             self.device.tap(center_x, center_y)
+            # tap 不再附带固定延时，等界面稳定后再返回，调用方可直接查找下一屏元素
+            self.device.wait_for_idle()
             print(f"✅ 点击元素成功: {identifier}")
             return True
         else:
@@ -302,6 +391,7 @@ class SmartElementFinder:
     def clear_cache(self):
         """清除所有缓存"""
         self.element_cache.clear()
+        self._dirty = False
         if os.path.exists(self.cache_file):
             os.remove(self.cache_file)
         print("🗑️ 缓存已清除")
@@ -3,13 +3,15 @@ WeChat Android Automation - Built from scratch
 微信 Android 自动化 - 从零构建
 """
 
-import time
 import cv2
 import numpy as np
 from PIL import Image
 from typing import List, Optional, Tuple
 from .core import AndroidDevice, UIAnalyzer, UIElement
 
+# 导航栏等非消息内容的固定文本
+_NAV_LABELS = frozenset(("微信", "通讯录", "发现", "我", "发送"))
+
 
 class WeChatAutomation:
     """微信自动化控制器"""
@@ -24,6 +26,12 @@ class WeChatAutomation:
     SEND_BUTTON_ID = "com.tencent.mm:id/anv"
     CONTACT_LIST_ID = "com.tencent.mm:id/e3k"
 
+    # 主界面特征文本
+    MAIN_SCREEN_TEXTS = ("微信", "通讯录")
+
+    # 截屏标注时绘制文本标签的最大元素数
+    ANNOTATION_LABEL_LIMIT = 50
+
     def __init__(self, device_id: Optional[str] = None):
         self.device = AndroidDevice(device_id)
         self.analyzer = UIAnalyzer(self.device)
@@ -36,32 +44,16 @@ class WeChatAutomation:
         self.is_wechat_running = True
 
         # 等待微信完全加载
-        time.sleep(3)
         self._wait_for_main_screen()
 
     def _wait_for_main_screen(self, timeout: int = 10):
         """等待主界面加载"""
         print("⏳ 等待微信主界面加载...")
 
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            try:
-                # 查找特征元素，如 "微信" 标题或底部导航
-                elements = self.analyzer.find_elements_by_text("微信")
-                if elements:
-                    print("✅ 微信主界面已加载")
-                    return
-
-                # 或查找底部导航栏
-                nav_elements = self.analyzer.find_elements_by_text("通讯录")
-                if nav_elements:
-                    print("✅ 微信主界面已加载")
-                    return
-
-            except Exception as e:
-                print(f"检查主界面状态时出错: {e}")
-
-            time.sleep(1)
+        # 查找特征元素，如 "微信" 标题或底部导航栏 "通讯录"，按指数退避轮询
+        if self.analyzer.wait_for_any_text(self.MAIN_SCREEN_TEXTS, timeout=timeout):
+            print("✅ 微信主界面已加载")
+            return
 
         raise Exception("微信主界面加载超时")
 
@@ -77,8 +69,10 @@ class WeChatAutomation:
                 contact = contact_elements[0]
                 center_x, center_y = self.analyzer.get_element_center(contact)
                 self.device.tap(center_x, center_y)
+                if not self._wait_for_chat_screen():
+                    print(f"❌ 点击联系人后未进入聊天界面: {contact_name}")
+                    return False
                 print(f"✅ 找到并点击联系人: {contact_name}")
-                time.sleep(2)
                 return True
 
             # 方法2: 使用搜索功能
@@ -104,21 +98,30 @@ class WeChatAutomation:
                 search_box = search_elements[0]
                 center_x, center_y = self.analyzer.get_element_center(search_box)
                 self.device.tap(center_x, center_y)
-                time.sleep(1)
+
+                # 等待搜索页的输入框出现后再输入
+                if not self.analyzer.wait_for_elements(lambda e: "EditText" in e.class_name, timeout=5):
+                    print("❌ 点击搜索后未出现搜索输入框")
+                    return False
 
                 # 输入联系人名称
                 self.device.input_text(contact_name)
-                time.sleep(2)
 
-                # 查找搜索结果中的联系人
-                result_elements = self.analyzer.find_elements_by_text(contact_name)
+                # 等待搜索结果中的联系人出现（排除搜索框本身）
+                result_elements = self.analyzer.wait_for_elements(
+                    lambda e: contact_name in e.text and "EditText" not in e.class_name,
+                    timeout=5
+                )
                 if result_elements:
                     # 点击第一个结果
                     result = result_elements[0]
                     center_x, center_y = self.analyzer.get_element_center(result)
                     self.device.tap(center_x, center_y)
+                    # 搜索框中仍是联系人名称，需排除，避免把搜索页误判为聊天界面
+                    if not self._wait_for_chat_screen(exclude_text=contact_name):
+                        print(f"❌ 点击搜索结果后未进入聊天界面: {contact_name}")
+                        return False
                     print(f"✅ 通过搜索找到联系人: {contact_name}")
-                    time.sleep(2)
                     return True
 
         except Exception as e:
@@ -141,56 +144,76 @@ class WeChatAutomation:
                 print("❌ 未找到消息输入框")
                 return False
 
-            # 点击输入框
-            input_box = input_elements[0]
-            center_x, center_y = self.analyzer.get_element_center(input_box)
-            self.device.tap(center_x, center_y)
-            time.sleep(0.5)
-
-            # 输入消息
-            self.device.input_text(message)
-            time.sleep(1)
-
-            # 查找发送按钮
-            send_elements = self.analyzer.find_elements_by_resource_id(self.SEND_BUTTON_ID)
-            if not send_elements:
-                # 尝试通过文本查找
-                send_elements = self.analyzer.find_elements_by_text("发送")
-
+            input_x, input_y = self.analyzer.get_element_center(input_elements[0])
+            # 点击输入框和输入消息合并为一次 ADB 往返
+            self.device.run_batch([
+                ['input', 'tap', input_x, input_y],  # 点击输入框
+                ['sleep', '1'],
+                ['input', 'text', self.device.encode_input_text(message)],  # 输入消息
+                ['sleep', '1'],
+            ])
+
+            # 发送按钮在输入文字后才出现，且键盘弹出后位置会变化，必须在输入后查找
+            send_elements = self._find_send_button()
             if send_elements:
                 # 点击发送按钮
                 send_button = send_elements[0]
                 center_x, center_y = self.analyzer.get_element_center(send_button)
                 self.device.tap(center_x, center_y)
+                self._wait_for_sent_message(message)
                 print(f"✅ 消息发送成功: {message}")
-                time.sleep(1)
                 return True
             else:
                 # 如果找不到发送按钮，尝试按回车键
                 self.device.press_key(66)  # KEYCODE_ENTER
+                self._wait_for_sent_message(message)
                 print(f"✅ 通过回车键发送消息: {message}")
-                time.sleep(1)
                 return True
 
         except Exception as e:
             print(f"发送消息失败: {e}")
             return False
 
+    def _wait_for_chat_screen(self, exclude_text: str = "", timeout: float = 5) -> bool:
+        """等待聊天界面的消息输入框出现"""
+        def is_chat_input(e: UIElement) -> bool:
+            if self.CHAT_INPUT_ID in e.resource_id:
+                return True
+            return ("EditText" in e.class_name and self.SEARCH_BOX_ID not in e.resource_id
+                    and not (exclude_text and exclude_text in e.text))
+
+        return bool(self.analyzer.wait_for_elements(is_chat_input, timeout=timeout))
+
+    def _wait_for_sent_message(self, message: str, timeout: float = 5) -> bool:
+        """等待已发送的消息出现在聊天记录中（排除输入框本身）"""
+        if self.analyzer.wait_for_elements(
+            lambda e: message in e.text and "EditText" not in e.class_name,
+            timeout=timeout
+        ):
+            return True
+
+        print(f"⚠️ 未在聊天记录中确认到消息: {message}")
+        return False
+
+    def _find_send_button(self) -> List[UIElement]:
+        """查找发送按钮"""
+        send_elements = self.analyzer.find_elements_by_resource_id(self.SEND_BUTTON_ID)
+        if not send_elements:
+            # 尝试通过文本查找
+            send_elements = self.analyzer.find_elements_by_text("发送")
+        return send_elements
+
     def get_latest_messages(self, count: int = 5) -> List[str]:
         """获取最新消息"""
         print(f"📥 获取最新 {count} 条消息...")
 
         try:
-            # 查找消息元素
+            # 查找消息元素（UIAnalyzer 缓存了解析结果和查询结果）
             message_elements = self.analyzer.find_elements_by_class("android.widget.TextView")
 
-            # 过滤出可能是消息内容的元素
-            messages = []
-            for element in message_elements:
-                if (element.text and
-                    len(element.text.strip()) > 0 and
-                    element.text not in ["微信", "通讯录", "发现", "我", "发送"]):
-                    messages.append(element.text.strip())
+            # 过滤出可能是消息内容的元素（一次遍历完成去空白和过滤）
+            messages = [text for element in message_elements
+                        if (text := element.text.strip()) and text not in _NAV_LABELS]
 
             # 返回最新的几条消息
             return messages[-count:] if messages else []
@@ -218,26 +241,28 @@ class WeChatAutomation:
         """截屏并标注 UI 元素"""
         print(f"📸 截屏并分析 UI 元素...")
 
-        # 截屏
-        img = self.device.take_screenshot()
+        # 截屏（原始 RGBA 帧缓冲，不经过 PIL）
+        frame = self.device.take_screenshot_array(reuse_buffer=True)
 
-        # 转换为 OpenCV 格式
-        cv_img = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+        # 直接在 RGB 数组上绘制并用 PIL 保存，省去 RGB→BGR 转换（标注颜色为绿色，通道顺序无关）
+        cv_img = np.ascontiguousarray(frame[:, :, :3])
 
         # 获取所有可点击元素
         try:
-            xml_content = self.device.dump_ui_hierarchy()
-            all_elements = self.analyzer._parse_elements_from_xml(xml_content)
-
-            # 在图片上标注元素
-            for element in all_elements:
-                if element.clickable and element.bounds:
-                    left, top, right, bottom = element.bounds
-
-                    # 画矩形框
-                    cv2.rectangle(cv_img, (left, top), (right, bottom), (0, 255, 0), 2)
-
-                    # 添加文本标签
+            all_elements = self.analyzer.get_all_elements()
+            clickable = [e for e in all_elements if e.clickable and e.bounds]
+
+            if clickable:
+                # 一次调用画出所有矩形框
+                rects = np.array([[[left, top], [right, top], [right, bottom], [left, bottom]]
+                                  for left, top, right, bottom in (e.bounds for e in clickable)],
+                                 dtype=np.int32)
+                cv2.polylines(cv_img, list(rects), isClosed=True, color=(0, 255, 0), thickness=2)
+
+            # 元素过多时标签会相互遮挡，跳过文本绘制
+            if len(clickable) <= self.ANNOTATION_LABEL_LIMIT:
+                for element in clickable:
+                    left, top = element.bounds[:2]
                     label = element.text or element.resource_id.split(':')[-1] if element.resource_id else "clickable"
                     cv2.putText(cv_img, label, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
 
@@ -245,7 +270,7 @@ class WeChatAutomation:
             print(f"UI 分析失败: {e}")
 
         # 保存标注后的图片
-        cv2.imwrite(save_path, cv_img)
+        Image.fromarray(cv_img).save(save_path)
         print(f"✅ 截屏已保存: {save_path}")
 
         return save_path